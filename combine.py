@@ -12,8 +12,10 @@ Usage:
 from __future__ import annotations
 import sys
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable
+from typing import BinaryIO, Iterable, Iterator
 
 # --- Default locations (edit these if you want to run without CLI args) ---
 DEFAULT_SRC_DIR = Path("/Users/JulioContreras/Desktop/School/Research/Baseball SuPro /SuPro Rewritten/src")
@@ -27,52 +29,163 @@ DEFAULT_EXTRA_PATHS = [
 ]
 # -------------------------------------------------------------------------
 
+# Typical junk files that never belong in the dump
+SKIP_FILE_NAMES = frozenset({".DS_Store"})
 
-def iter_files(root: Path, exclude_dir: Path) -> Iterable[Path]:
+
+def iter_files(root: Path, exclude_dir: Path) -> Iterable[str]:
     """
-    Yield all files under `root`, skipping anything inside `exclude_dir`.
+    Yield the (resolved, absolute) path strings of all files under `root`,
+    skipping anything inside `exclude_dir`.
     """
     root = root.resolve()
     exclude_dir = exclude_dir.resolve()
-    for dirpath, dirnames, filenames in os.walk(root):
-        current = Path(dirpath).resolve()
-
-        # If we're at/inside the excluded folder, prune it from traversal.
-        # (Modify dirnames in-place so os.walk won't descend.)
-        # Compare using .resolve() to be robust to symlinks.
-        dirnames[:] = [
-            d for d in dirnames
-            if (Path(dirpath) / d).resolve() != exclude_dir
-            and not d.startswith(".git")   # nice to skip VCS internals if present
-        ]
-
-        # Skip everything if this subtree is the excluded path
-        if current == exclude_dir or exclude_dir in current.parents:
-            continue
-
-        for fn in filenames:
-            p = current / fn
-            # Skip typical junk files
-            if fn == ".DS_Store":
-                continue
-            yield p
-
-
-def read_file_as_text(path: Path) -> str:
+    if root == exclude_dir or exclude_dir in root.parents:
+        return
+
+    # Walk with os.scandir and an explicit stack: each DirEntry already knows its
+    # type from the directory listing, so there's no extra stat per entry.
+    # Like os.walk, symlinked directories are listed but never descended, so
+    # starting from the resolved root every entry.path is already resolved and
+    # the excluded folder can be matched with a plain string comparison.
+    exclude = str(exclude_dir)
+    stack = [str(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue  # unreadable directory - os.walk skips these too
+        with it:
+            for entry in it:
+                if entry.is_dir():
+                    if (entry.path != exclude
+                            and not entry.name.startswith(".git")   # nice to skip VCS internals if present
+                            and not entry.is_symlink()):
+                        stack.append(entry.path)
+                elif entry.name not in SKIP_FILE_NAMES:
+                    yield entry.path
+
+
+RULE = b"=" * 80
+COPY_CHUNK = 1 << 20
+SNIFF_SIZE = 4096
+BINARY_PLACEHOLDER = b"<<binary omitted>>"
+
+# Files up to PREFETCH_LIMIT bytes are read ahead by READ_WORKERS threads, at
+# most READ_AHEAD files beyond the one being written (so memory stays bounded)
+READ_WORKERS = 8
+READ_AHEAD = 4 * READ_WORKERS
+PREFETCH_LIMIT = COPY_CHUNK
+
+# Most bytes copied from a file reporting st_size 0, which can't be bounded by size
+SPECIAL_FILE_LIMIT = 16 * COPY_CHUNK
+
+
+# Cleared the first time the kernel refuses a file-to-file sendfile (macOS only
+# sends to sockets), after which everything is copied through userspace
+_use_sendfile = hasattr(os, "sendfile")
+
+
+def read_error(e: Exception) -> bytes:
+    return f"<<ERROR READING FILE: {e}>>".encode("utf-8", errors="replace")
+
+
+def read_small_file(path: str) -> bytes | None:
+    """
+    Read a file's dump contents with a single pread, for use in a worker thread.
+    Returns None for files larger than PREFETCH_LIMIT (or reporting st_size 0),
+    which are left for copy_file_contents to stream.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        return read_error(e)
+
+    try:
+        size = os.fstat(fd).st_size
+        if not 0 < size <= PREFETCH_LIMIT:
+            return None
+        data = os.pread(fd, size, 0)
+        if len(data) < size:
+            return None  # Shrank under us - let the streaming path sort it out
+        return BINARY_PLACEHOLDER if b"\x00" in data[:SNIFF_SIZE] else data
+    except Exception as e:
+        return read_error(e)
+    finally:
+        os.close(fd)
+
+
+def read_ahead(paths: Iterable[str]) -> Iterator[tuple[str, bytes | None]]:
+    """
+    Yield (path, read_small_file(path)) in order, with the reads for the files
+    that follow already in flight on a thread pool. Overlapping the reads keeps
+    several requests queued at the disk instead of one at a time.
     """
-    Read a file as UTF-8 text, falling back to replacement characters on decode errors.
-    If the file is truly binary, you'll still get a readable best-effort dump.
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        pending = deque()
+        for p in paths:
+            pending.append((p, pool.submit(read_small_file, p)))
+            if len(pending) > READ_AHEAD:
+                p, future = pending.popleft()
+                yield p, future.result()
+        while pending:
+            p, future = pending.popleft()
+            yield p, future.result()
+
+
+def copy_file_contents(path: str | Path, out: BinaryIO) -> None:
     """
+    Copy a file's bytes into the binary file `out`, in kernel space with
+    os.sendfile where the platform allows it and in chunks through userspace
+    otherwise, so the file is never held in memory or decoded.
+    A file with a NUL byte in its first 4 KiB is treated as binary (the same sniff
+    file(1) uses) and replaced by a placeholder instead of being dumped.
+    """
+    global _use_sendfile
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        out.write(read_error(e))
+        return
+
     try:
-        # Try straightforward UTF-8 first
-        return path.read_text(encoding="utf-8")
-    except UnicodeDecodeError:
-        # Fallback: decode with replacement to avoid crashing
-        with path.open("rb") as f:
-            data = f.read()
-        return data.decode("utf-8", errors="replace")
+        if b"\x00" in os.pread(fd, SNIFF_SIZE, 0):
+            out.write(BINARY_PLACEHOLDER)
+            return
+
+        # st_size is 0 for some special files (e.g. under /proc); those get
+        # one snapshot of at most SPECIAL_FILE_LIMIT bytes
+        size = os.fstat(fd).st_size
+        if _use_sendfile and size:
+            out.flush()  # sendfile writes to the fd directly, behind the buffer
+            offset = 0
+            try:
+                while offset < size:
+                    sent = os.sendfile(out.fileno(), fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return
+            except OSError:
+                if offset:
+                    raise
+                _use_sendfile = False
+
+        # Stop at the size seen above, like the sendfile loop: a file that
+        # grows while it's copied would otherwise never reach EOF
+        limit = size or SPECIAL_FILE_LIMIT
+        offset = 0
+        while offset < limit:
+            chunk = os.pread(fd, min(COPY_CHUNK, limit - offset), offset)
+            if not chunk:
+                break
+            out.write(chunk)
+            offset += len(chunk)
     except Exception as e:
-        return f"<<ERROR READING FILE: {e}>>"
+        out.write(read_error(e))
+    finally:
+        os.close(fd)
 
 
 def write_combined_output(
@@ -93,38 +206,44 @@ def write_combined_output(
 
     out_file.parent.mkdir(parents=True, exist_ok=True)
 
-    files = sorted(iter_files(src_dir, exclude_dir))
+    # Sorting on path components keeps the same order Path objects would give
+    # (e.g. "a/b.rs" before "a.rs"), without building a Path per file.
+    # The output itself is left out when it lives inside the tree (the default
+    # setup) - it's being rewritten, so the previous run's dump isn't content.
+    out_path = str(out_file)
+    files = sorted((p for p in iter_files(src_dir, exclude_dir) if p != out_path),
+                   key=lambda p: p.split(os.sep))
+    src_prefix_len = len(os.path.join(str(src_dir), ""))
     count = 0
 
-    with out_file.open("w", encoding="utf-8") as out:
-        out.write(f"# Combined dump of {src_dir}\n")
-        out.write(f"# Excluding: {exclude_dir}\n\n")
-
-        for p in files:
-            rel = p.relative_to(src_dir)
-            out.write("\n")
-            out.write("=" * 80 + "\n")
-            out.write(f"FILE: {rel}\n")
-            out.write("=" * 80 + "\n\n")
-            out.write(read_file_as_text(p))
-            out.write("\n")
+    # Headers and small files are batched through one large buffer, written
+    # in order as their reads complete
+    with open(out_file, "wb", buffering=COPY_CHUNK) as out:
+        out.write(b"# Combined dump of %s\n" % os.fsencode(src_dir))
+        out.write(b"# Excluding: %s\n\n" % os.fsencode(exclude_dir))
+
+        for p, data in read_ahead(files):
+            rel = p[src_prefix_len:]
+            out.write(b"\n%s\nFILE: %s\n%s\n\n" % (RULE, os.fsencode(rel), RULE))
+            if data is None:
+                copy_file_contents(p, out)
+            else:
+                out.write(data)
+            out.write(b"\n")
             count += 1
 
         # --- append extras at the very end ---
         if extra_paths:
-            out.write("\n")
-            out.write("#" * 80 + "\n")
-            out.write("# EXTRA FILES (appended after source tree)\n")
-            out.write("#" * 80 + "\n\n")
+            out.write(b"\n")
+            out.write(b"#" * 80 + b"\n")
+            out.write(b"# EXTRA FILES (appended after source tree)\n")
+            out.write(b"#" * 80 + b"\n\n")
 
             for xp in extra_paths:
                 xp = Path(xp).resolve()
-                out.write("\n")
-                out.write("=" * 80 + "\n")
-                out.write(f"EXTRA FILE: {xp}\n")
-                out.write("=" * 80 + "\n\n")
-                out.write(read_file_as_text(xp))
-                out.write("\n")
+                out.write(b"\n%s\nEXTRA FILE: %s\n%s\n\n" % (RULE, os.fsencode(xp), RULE))
+                copy_file_contents(xp, out)
+                out.write(b"\n")
 
     print(f"Wrote {count} in-tree files + {len(list(extra_paths or []))} extras into: {out_file}")
 
@@ -0,0 +1,26 @@
+#landmarks.py
+import numpy as np
+
+def landmarks_to_array(landmark_list):
+    """Return the x/y/z of a landmark list as an (N, 3) float32 array.
+    
+    Reads the serialized protobuf in one pass instead of calling the Python
+    accessors three times per landmark: every landmark is encoded as the same
+    fixed-size record starting with the fixed32 x, y and z fields, so they can
+    be picked out with a strided view. Falls back to the accessors if the
+    encoding doesn't have that layout.
+    """
+    landmarks = landmark_list.landmark
+    raw = landmark_list.SerializeToString()
+    n = len(landmarks)
+    # raw[1] is the first record's length; x, y and z are tagged 0x0d, 0x15
+    # and 0x1d at offsets 2, 7 and 12 of every record (tag byte + 4 bytes each)
+    if n and 15 <= raw[1] < 0x80:
+        size = raw[1] + 2
+        if (len(raw) == n * size
+                and raw[0::size] == b'\x0a' * n
+                and raw[2::size] == b'\x0d' * n
+                and raw[7::size] == b'\x15' * n
+                and raw[12::size] == b'\x1d' * n):
+            return np.ndarray((n, 3), dtype='<f4', buffer=raw, offset=3, strides=(size, 5)).copy()
+    return np.array([[lm.x, lm.y, lm.z] for lm in landmarks], dtype=np.float32)
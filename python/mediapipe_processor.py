@@ -4,6 +4,16 @@ import numpy as np
 import json
 import cv2
 
+from landmarks import landmarks_to_array
+
+# Incoming frame size and the size frames are downscaled to before colour
+# conversion. Halving each side keeps the aspect ratio (so normalized landmarks
+# still map onto the full frame) while cutting the pixels touched per frame by 4x.
+FRAME_WIDTH = 1280
+FRAME_HEIGHT = 720
+INPUT_WIDTH = 640
+INPUT_HEIGHT = 360
+
 class MediaPipeProcessor:
     def __init__(self):
         self.mp_pose = mp.solutions.pose
@@ -26,15 +36,35 @@ class MediaPipeProcessor:
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
+        
+        # Reused every frame so resize/cvtColor write into warm memory instead
+        # of allocating fresh arrays
+        self._small = np.empty((INPUT_HEIGHT, INPUT_WIDTH, 3), dtype=np.uint8)
+        self._rgb = np.empty_like(self._small)
     
-    def process_frame(self, frame_data):
-        """Process a frame and return landmarks"""
+    def process_frame(self, frame_data, pixel_format='BGR'):
+        """Process a frame and return landmarks.
+
+        `pixel_format` is the channel order of `frame_data` ('RGB' or 'BGR').
+        RGB frames are handed to MediaPipe as-is; BGR is the legacy path.
+        """
         # Convert frame data to numpy array
         frame = np.frombuffer(frame_data, dtype=np.uint8)
-        frame = frame.reshape((720, 1280, 3))  # Adjust dimensions as needed
+        frame = frame.reshape((FRAME_HEIGHT, FRAME_WIDTH, 3))
+        
+        small = cv2.resize(frame, (INPUT_WIDTH, INPUT_HEIGHT), dst=self._small,
+                           interpolation=cv2.INTER_AREA)
+        if pixel_format == 'RGB':
+            rgb_frame = small
+        else:
+            # Legacy BGR producers: convert after the downscale, never before
+            rgb_frame = cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self._rgb)
         
-        # Convert BGR to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # A read-only C-contiguous array is passed to MediaPipe by reference
+        # instead of copied; the flag goes on a view so the preallocated
+        # buffers stay writable for the next frame
+        rgb_frame = np.ascontiguousarray(rgb_frame).view()
+        rgb_frame.flags.writeable = False
         
         # Process with MediaPipe
         pose_results = self.pose.process(rgb_frame)
@@ -46,18 +76,11 @@ class MediaPipeProcessor:
         }
         
         if pose_results.pose_landmarks:
-            result['pose_landmarks'] = [
-                [lm.x, lm.y, lm.z] 
-                for lm in pose_results.pose_landmarks.landmark
-            ]
+            result['pose_landmarks'] = landmarks_to_array(pose_results.pose_landmarks).tolist()
         
         if hands_results.multi_hand_landmarks:
             for hand_landmarks in hands_results.multi_hand_landmarks:
-                hand_data = [
-                    [lm.x, lm.y, lm.z] 
-                    for lm in hand_landmarks.landmark
-                ]
-                result['hand_landmarks'].append(hand_data)
+                result['hand_landmarks'].append(landmarks_to_array(hand_landmarks).tolist())
         
         return json.dumps(result)
     
@@ -1,113 +1,491 @@
 #!/usr/bin/env python3
 import sys
-import json
+import argparse
+import contextlib
+import queue
+import threading
+import time
 import numpy as np
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
 
 try:
     import mediapipe as mp
     import cv2
+    import msgpack
+    import orjson
 except ImportError as e:
     print(f"Error: Missing required packages: {e}", file=sys.stderr)
-    print("Install with: pip3 install mediapipe opencv-python numpy", file=sys.stderr)
+    print("Install with: pip3 install mediapipe opencv-python numpy msgpack orjson", file=sys.stderr)
     sys.exit(1)
 
+from landmarks import landmarks_to_array
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    # Numba is optional - without it the helpers below run as plain NumPy
+    HAVE_NUMBA = False
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+EMPTY_RESULT = {'pose_landmarks': [], 'hand_landmarks': []}
+
+# Automatic level-of-detail: frames to let the latency average settle after a
+# change, and the smallest long side the input is ever downscaled to
+LOD_SETTLE_FRAMES = 30
+LOD_MIN_INPUT_SIZE = 256
+
+# Queued in place of a frame that was skipped to hold target_fps
+SKIPPED = object()
+# Queued for a {'reset': true} message, sent between clips
+RESET = object()
+
+# Pose landmark indices used for body-centred normalization and hand gating
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_HIP, RIGHT_HIP = 23, 24
+
+# Hands only runs while pose sees at least one wrist with this visibility
+WRIST_VISIBILITY = 0.5
+
+# Full tracebacks are printed for the 1st, 257th, 513th... error only
+TRACEBACK_MASK = 0xFF
+
+@njit(cache=True, fastmath=True)
+def normalize_landmarks(landmarks):
+    """Centre (33, 3) pose landmarks on the hip midpoint and scale by torso length.
+    
+    The result doesn't depend on where the person stands or how far they are
+    from the camera, which is what feature extraction downstream wants.
+    """
+    hip = (landmarks[LEFT_HIP] + landmarks[RIGHT_HIP]) * np.float32(0.5)
+    shoulder = (landmarks[LEFT_SHOULDER] + landmarks[RIGHT_SHOULDER]) * np.float32(0.5)
+    torso = np.sqrt(np.sum((shoulder - hip) ** 2))
+    if torso < 1e-6:
+        torso = np.float32(1.0)
+    return (landmarks - hip) / torso
+
 class MediaPipeService:
-    def __init__(self):
-        # Initialize pose tracking
+    def __init__(self, shm_names=(), wire_format='msgpack', model_complexity=1,
+                 hands_enabled=True, target_input_size=None, target_fps=None,
+                 normalized_pose=False):
         self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
+        self.mp_hands = mp.solutions.hands
+        self.pose_complexity = model_complexity
+        self.hands_complexity = min(model_complexity, 1)  # Hands only has 0 and 1
+        self.hands_enabled = hands_enabled
+        
+        # Initialize pose tracking
+        self.pose = self.build_pose()
+        
+        # Initialize hand tracking
+        self.hands = self.build_hands() if hands_enabled else None
+        
+        # Frames larger than this (long side, in pixels) are downscaled before
+        # inference; aspect ratio is kept so normalized landmarks are unaffected
+        self.target_input_size = target_input_size
+        
+        # With a target frame rate each frame gets 1/target_fps seconds, which
+        # is used two ways:
+        # - a moving average of inference latency drives automatic downgrades
+        #   (cheaper models, then smaller input) until frames fit in the budget;
+        #   lod_enabled goes False once there is nothing left to give up
+        # - frames arriving less than a budget after the last processed one are
+        #   answered with that frame's landmarks instead of being decoded and
+        #   run through the models. Timing uses the frame's 'pts' (seconds) when
+        #   the producer sends one, arrival time otherwise.
+        self.frame_budget = 1.0 / target_fps if target_fps else None
+        self.lod_enabled = self.frame_budget is not None
+        self.latency_avg = None
+        self.frames_since_lod_change = 0
+        self.last_pts = None
+        self.last_result = EMPTY_RESULT
+        
+        # Optionally add 'pose_normalized' (body-centred, torso-scaled landmarks)
+        # to each result. Calling the helper once here gets Numba's compile out
+        # of the way before the first real frame.
+        self.normalized_pose = normalized_pose
+        if normalized_pose:
+            if not HAVE_NUMBA:
+                print("Numba not installed - pose normalization runs uncompiled "
+                      "(pip3 install numba)", file=sys.stderr)
+            normalize_landmarks(np.zeros((33, 3), dtype=np.float32))
+        
+        # Hands runs on this worker while Pose runs on the calling thread; the
+        # graphs release the GIL while they run, so the two models overlap
+        self.hands_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hands')
+        
+        # Whether the last pose result had a visible wrist. Hands is skipped
+        # when it didn't - the gate uses the previous frame so Hands can still
+        # start alongside Pose instead of waiting for this frame's result.
+        self.wrists_visible = True
+        
+        # Errors seen so far, for rate-limiting tracebacks (see log_traceback)
+        self.error_count = 0
+        
+        # Shared-memory frame slots, keyed by name. A producer that writes pixels
+        # into shared memory only sends {width, height, shm_name, frame_id} on
+        # stdin; frames without 'shm_name' still carry the pixels inline.
+        # Producers may rotate through several slots to keep frames in flight.
+        self.shm_segments = {}
+        for name in shm_names:
+            self.attach_shm(name)
+        
+        # Frames arrive as a stream of msgpack maps with the pixels as a bin field,
+        # which decodes in C without boxing every byte. 'json' keeps the old
+        # one-object-per-line protocol for producers that haven't switched.
+        self.wire_format = wire_format
+        self.unpacker = msgpack.Unpacker(raw=False)
+        # Results go to the real stdout even while sys.stdout is redirected
+        self.result_stream = sys.stdout.buffer
+        
+        print(f"MediaPipe service initialized (pose complexity {self.pose_complexity}, "
+              f"hands {'enabled' if hands_enabled else 'disabled'})", file=sys.stderr)
+    
+    def build_pose(self, complexity=None):
+        return self.mp_pose.Pose(
             static_image_mode=False,
-            model_complexity=1,  # Changed from 0 to 1 for better accuracy
+            model_complexity=self.pose_complexity if complexity is None else complexity,
             smooth_landmarks=True,
             enable_segmentation=False,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5  # Increased from 0.3
         )
-        
-        # Initialize hand tracking - ENABLED
-        self.mp_hands = mp.solutions.hands
-        self.hands = self.mp_hands.Hands(
+    
+    def build_hands(self, complexity=None):
+        return self.mp_hands.Hands(
             static_image_mode=False,
             max_num_hands=2,
-            model_complexity=1,  # Changed from 0 to 1
+            model_complexity=self.hands_complexity if complexity is None else complexity,
             min_detection_confidence=0.4,  # Lowered from 0.5
             min_tracking_confidence=0.4
         )
+    
+    def attach_shm(self, name):
+        segment = self.shm_segments.get(name)
+        if segment is None:
+            segment = shared_memory.SharedMemory(name=name)
+            # The producer owns the segment - don't let our resource tracker
+            # unlink it when this process exits
+            resource_tracker.unregister(segment._name, 'shared_memory')
+            self.shm_segments[name] = segment
+            print(f"Attached shared memory frame slot {name} ({segment.size} bytes)", file=sys.stderr)
+        return segment
+    
+    def decode_frame(self, frame_data):
+        """Turn a frame message into an RGB ndarray"""
+        width = frame_data['width']
+        height = frame_data['height']
+        
+        if 'shm_name' in frame_data:
+            # Zero copy: view the producer's buffer directly
+            segment = self.attach_shm(frame_data['shm_name'])
+            frame = np.ndarray((height, width, 3), dtype=np.uint8, buffer=segment.buf)
+        else:
+            # Inline fallback: pixels travel in the message itself
+            data = frame_data['data']
+            if isinstance(data, bytes):
+                data = np.frombuffer(data, dtype=np.uint8)
+            else:
+                data = np.array(data, dtype=np.uint8)  # JSON list of ints
+            frame = data.reshape((height, width, 3))
         
-        print("MediaPipe service initialized with hands enabled", file=sys.stderr)
+        input_size = self.target_input_size
+        if input_size and max(width, height) > input_size:
+            scale = input_size / max(width, height)
+            frame = cv2.resize(frame, (round(width * scale), round(height * scale)),
+                               interpolation=cv2.INTER_AREA)
+        
+        # The Rust bridge sends RGB; only legacy BGR producers need converting
+        if frame_data.get('format', 'RGB') == 'BGR':
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        
+        return frame
     
-    def process_frame(self, frame_data):
+    def process_frame(self, frame):
         try:
-            width = frame_data['width']
-            height = frame_data['height']
-            data = np.array(frame_data['data'], dtype=np.uint8)
+            start = time.perf_counter()
             
-            # Reshape frame
-            frame = data.reshape((height, width, 3))
+            # A read-only C-contiguous array is passed to MediaPipe by reference
+            # instead of copied (shared-memory frames arrive writable)
+            frame = np.ascontiguousarray(frame).view()
+            frame.flags.writeable = False
             
-            # Process with MediaPipe
+            # Process with MediaPipe - both models at once
+            hands_future = None
+            if self.hands_enabled and self.wrists_visible:
+                hands_future = self.hands_executor.submit(self.hands.process, frame)
             pose_results = self.pose.process(frame)
-            hands_results = self.hands.process(frame)
+            hands_results = hands_future.result() if hands_future else None
+            
+            self.update_lod(time.perf_counter() - start, frame)
             
             result = {
                 'pose_landmarks': [],
                 'hand_landmarks': []
             }
             
+            # Landmarks stay ndarrays; orjson serializes them directly
+            self.wrists_visible = False
             if pose_results.pose_landmarks:
-                result['pose_landmarks'] = [
-                    [lm.x, lm.y, lm.z] 
-                    for lm in pose_results.pose_landmarks.landmark
-                ]
+                landmarks = pose_results.pose_landmarks.landmark
+                self.wrists_visible = max(landmarks[LEFT_WRIST].visibility,
+                                          landmarks[RIGHT_WRIST].visibility) > WRIST_VISIBILITY
+                result['pose_landmarks'] = landmarks_to_array(pose_results.pose_landmarks)
+                if self.normalized_pose:
+                    result['pose_normalized'] = normalize_landmarks(result['pose_landmarks'])
             
-            # PROCESS HANDS - ENABLED
-            if hands_results.multi_hand_landmarks:
+            if hands_results and hands_results.multi_hand_landmarks:
                 for hand_landmarks in hands_results.multi_hand_landmarks:
-                    hand_data = [
-                        [lm.x, lm.y, lm.z] 
-                        for lm in hand_landmarks.landmark
-                    ]
-                    result['hand_landmarks'].append(hand_data)
+                    result['hand_landmarks'].append(landmarks_to_array(hand_landmarks))
             
             return result
             
         except Exception as e:
             print(f"Error processing frame: {e}", file=sys.stderr)
+            self.log_traceback()
+            return dict(EMPTY_RESULT)
+    
+    def log_traceback(self):
+        """Print the current exception's traceback, but only for every 256th error.
+        
+        A burst of bad frames would otherwise format and write a full stack per
+        frame, stalling the pipeline on stderr. The one-line message is still
+        printed for each error by the caller.
+        """
+        self.error_count += 1
+        if self.error_count & TRACEBACK_MASK == 1:
+            if self.error_count > 1:
+                print(f"({self.error_count - 1} errors so far, tracebacks rate-limited)", file=sys.stderr)
             traceback.print_exc(file=sys.stderr)
-            return {'pose_landmarks': [], 'hand_landmarks': []}
     
-    def run(self):
-        print("READY", file=sys.stdout)
-        sys.stdout.flush()
-        print("MediaPipe service ready with hands tracking", file=sys.stderr)
+    def reset_tracking(self):
+        """Forget the previous clip: restart the graphs' landmark tracking and smoothing.
+        
+        The models stay loaded, so the host can keep one service process for a
+        whole session instead of paying interpreter + model startup per clip.
+        """
+        self.pose.reset()
+        if self.hands:
+            self.hands.reset()
+        self.last_result = EMPTY_RESULT
+        self.wrists_visible = True
+        print("Tracking state reset for a new clip", file=sys.stderr)
+    
+    def update_lod(self, latency, frame):
+        """Step down one level of detail when inference can't keep up with target_fps"""
+        if not self.lod_enabled:
+            return
+        
+        if self.latency_avg is None:
+            self.latency_avg = latency
+        else:
+            self.latency_avg = 0.9 * self.latency_avg + 0.1 * latency
+        self.frames_since_lod_change += 1
+        if (self.frames_since_lod_change < LOD_SETTLE_FRAMES
+                or self.latency_avg <= self.frame_budget):
+            return
+        
+        print(f"Inference averaging {self.latency_avg * 1000:.1f} ms over a "
+              f"{self.frame_budget * 1000:.1f} ms budget - downgrading", file=sys.stderr)
+        input_size = max(frame.shape[:2])
+        try:
+            # New graphs are built before the old ones are closed, so a model that
+            # fails to load leaves the current one running. MediaPipe announces
+            # model downloads with print(), which must not reach the result stream.
+            with contextlib.redirect_stdout(sys.stderr):
+                if self.hands_enabled and self.hands_complexity > 0:
+                    hands = self.build_hands(complexity=0)
+                    self.hands.close()
+                    self.hands, self.hands_complexity = hands, 0
+                    print("Switched to hands model complexity 0", file=sys.stderr)
+                elif self.pose_complexity > 0:
+                    pose = self.build_pose(complexity=self.pose_complexity - 1)
+                    self.pose.close()
+                    self.pose, self.pose_complexity = pose, self.pose_complexity - 1
+                    print(f"Switched to pose model complexity {self.pose_complexity}", file=sys.stderr)
+                elif input_size > LOD_MIN_INPUT_SIZE:
+                    self.target_input_size = max(LOD_MIN_INPUT_SIZE, input_size // 2)
+                    print(f"Downscaling input to {self.target_input_size}px", file=sys.stderr)
+                else:
+                    self.lod_enabled = False  # Nothing left to give up
+        except Exception as e:
+            print(f"Level of detail change failed, keeping current models: {e}", file=sys.stderr)
+            self.lod_enabled = False
+        
+        self.latency_avg = None
+        self.frames_since_lod_change = 0
+    
+    def read_frame(self):
+        """Read the next frame message from stdin, or None at end of input"""
+        if self.wire_format == 'json':
+            line = sys.stdin.buffer.readline()
+            if not line:
+                return None
+            return orjson.loads(line)
+        
+        # Feed whatever is available (read1 doesn't block for a full chunk) until
+        # the unpacker has a complete message
+        while True:
+            try:
+                return next(self.unpacker)
+            except StopIteration:
+                chunk = sys.stdin.buffer.read1(1 << 20)
+                if not chunk:
+                    return None
+                self.unpacker.feed(chunk)
+            except ValueError:
+                # A corrupt stream can't be resynchronised; drop what's buffered
+                self.unpacker = msgpack.Unpacker(raw=False)
+                raise
+    
+    def write_result(self, result):
+        # Results stay newline-delimited JSON so the Rust side can read them by line
+        self.result_stream.write(orjson.dumps(
+            result, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY))
+        self.result_stream.flush()
+    
+    def reader_loop(self, read_q):
+        """Stage 1: decode stdin into (frame_id, frame) items; None marks end of input.
         
+        Every message yields exactly one item so responses stay one-per-frame -
+        frame is None when the message couldn't be decoded, SKIPPED when it
+        was dropped to hold target_fps, and RESET for a reset message.
+        """
         while True:
+            frame_id = None
             try:
-                line = sys.stdin.readline()
-                if not line:
+                frame_data = self.read_frame()
+                if frame_data is None:
                     print("End of input stream", file=sys.stderr)
-                    break
+                    read_q.put(None)
+                    return
                 
-                frame_data = json.loads(line)
-                result = self.process_frame(frame_data)
-                print(json.dumps(result))
-                sys.stdout.flush()
+                frame_id = frame_data.get('frame_id')
+                if frame_data.get('reset'):
+                    self.last_pts = None
+                    read_q.put((frame_id, RESET))
+                elif self.should_skip(frame_data):
+                    # Cheap advance: the pixels are never even wrapped in an array
+                    read_q.put((frame_id, SKIPPED))
+                else:
+                    read_q.put((frame_id, self.decode_frame(frame_data)))
                 
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}", file=sys.stderr)
-                print(json.dumps({'pose_landmarks': [], 'hand_landmarks': []}))
-                sys.stdout.flush()
+            except ValueError as e:
+                # Malformed msgpack or JSON input, or a frame of the wrong size
+                print(f"Frame decode error: {e}", file=sys.stderr)
+                read_q.put((frame_id, None))
             except Exception as e:
                 print(f"Service error: {e}", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
-                print(json.dumps({'pose_landmarks': [], 'hand_landmarks': []}))
-                sys.stdout.flush()
+                self.log_traceback()
+                read_q.put((frame_id, None))
+    
+    def should_skip(self, frame_data):
+        if self.frame_budget is None:
+            return False
+        pts = frame_data.get('pts')
+        if pts is None:
+            pts = time.monotonic()
+        # A timestamp going backwards means a new stream - always process it
+        if self.last_pts is not None and 0 <= pts - self.last_pts < self.frame_budget:
+            return True
+        self.last_pts = pts
+        return False
+    
+    def writer_loop(self, write_q):
+        """Stage 3: serialize results to stdout until None is received"""
+        while True:
+            result = write_q.get()
+            if result is None:
+                return
+            try:
+                self.write_result(result)
+            except Exception as e:
+                print(f"Error writing result: {e}", file=sys.stderr)
+    
+    def run(self, prefetch=4):
+        print("READY", file=sys.stdout)
+        sys.stdout.flush()
+        print("MediaPipe service ready with hands tracking", file=sys.stderr)
+        
+        # Three-stage pipeline: stdin decode and result serialization run on
+        # their own threads so they overlap with inference on this one. The
+        # queues are bounded so a fast producer gets back-pressure instead of
+        # piling frames up in memory.
+        read_q = queue.Queue(maxsize=prefetch)
+        write_q = queue.Queue(maxsize=prefetch)
+        reader = threading.Thread(target=self.reader_loop, args=(read_q,), daemon=True)
+        writer = threading.Thread(target=self.writer_loop, args=(write_q,), daemon=True)
+        reader.start()
+        writer.start()
+        
+        while True:
+            item = read_q.get()
+            if item is None:
+                break
+            
+            frame_id, frame = item
+            if frame is None:
+                result = EMPTY_RESULT
+            elif frame is SKIPPED:
+                result = self.last_result
+            elif frame is RESET:
+                self.reset_tracking()
+                result = EMPTY_RESULT
+            else:
+                result = self.last_result = self.process_frame(frame)
+            
+            # Echo the id so a producer rotating shared-memory slots knows which one is free
+            if frame_id is not None:
+                result = {**result, 'frame_id': frame_id}
+            write_q.put(result)
+        
+        write_q.put(None)
+        writer.join()
+    
+    def cleanup(self):
+        self.hands_executor.shutdown()
+        self.pose.close()
+        if self.hands:
+            self.hands.close()
+        for segment in self.shm_segments.values():
+            segment.close()
+        self.shm_segments.clear()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="MediaPipe pose/hand tracking service")
+    parser.add_argument('--shm', action='append', default=[], metavar='NAME',
+                        help="shared memory frame slot to attach at startup (repeatable)")
+    parser.add_argument('--wire', choices=['msgpack', 'json'], default='msgpack',
+                        help="stdin frame encoding (default: msgpack)")
+    parser.add_argument('--model-complexity', type=int, choices=[0, 1, 2], default=1,
+                        help="pose model complexity; hands uses at most 1 (default: 1)")
+    parser.add_argument('--no-hands', dest='hands_enabled', action='store_false',
+                        help="skip hand tracking entirely")
+    parser.add_argument('--input-size', type=int, metavar='PX',
+                        help="downscale frames so their long side is at most PX")
+    parser.add_argument('--target-fps', type=float,
+                        help="frame rate to sustain; inference downgrades itself to keep up, and "
+                             "frames arriving faster are answered with the last frame's landmarks")
+    parser.add_argument('--normalized-pose', action='store_true',
+                        help="also return pose landmarks centred on the hips and scaled by torso length")
+    args = parser.parse_args()
+    
     try:
-        service = MediaPipeService()
+        service = MediaPipeService(
+            shm_names=args.shm,
+            wire_format=args.wire,
+            model_complexity=args.model_complexity,
+            hands_enabled=args.hands_enabled,
+            target_input_size=args.input_size,
+            target_fps=args.target_fps,
+            normalized_pose=args.normalized_pose,
+        )
         service.run()
+        service.cleanup()
     except Exception as e:
         print(f"Failed to start service: {e}", file=sys.stderr)
         sys.exit(1)
\ No newline at end of file
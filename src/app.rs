@@ -203,12 +203,12 @@ impl ArmTrackerApp {
         self.current_result = TrackingResult::default();
         self.last_valid_result = None;
         
+        // Keep the MediaPipe service warm for the next camera session or video
         if let Ok(mut tracker) = self.tracker.lock() {
-            tracker.shutdown_mediapipe();
+            tracker.reset_mediapipe_session();
         }
         
-        self.mediapipe_status = MediaPipeStatus::NotInitialized;
-        eprintln!("Camera and MediaPipe stopped");
+        eprintln!("Camera stopped");
     }
     
     fn start_camera(&mut self) {
@@ -269,8 +269,10 @@ impl ArmTrackerApp {
                     self.processing_complete = false;
                     self.processing_message = "Processing video...".to_string();
                     
-                    // Initialize MediaPipe for video processing
+                    // Initialize MediaPipe for video processing, starting from
+                    // fresh tracking state if the service is already running
                     if let Ok(mut tracker) = self.tracker.lock() {
+                        tracker.reset_mediapipe_session();
                         tracker.initialize_mediapipe();
                     }
                     
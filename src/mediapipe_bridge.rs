@@ -2,18 +2,26 @@
 use anyhow::{Result, Context};
 use nalgebra::Vector3;
 use std::process::{Command, Stdio, Child};
-use std::io::{Write, BufRead, BufReader};
+use std::io::{Write, BufRead, BufReader, BufWriter};
 use serde::{Deserialize, Serialize};
 use image::DynamicImage;
 use std::time::{Duration, Instant};
 
-#[derive(Debug, Serialize, Deserialize)]
+#[derive(Debug, Serialize)]
 struct MediaPipeFrame {
     width: u32,
     height: u32,
+    format: &'static str,  // Channel order of `data`, so Python can skip cvtColor
+    #[serde(with = "serde_bytes")]  // msgpack bin, not an array of ints
     data: Vec<u8>,
 }
 
+// Tells the service a new clip is starting (tracking state is cleared)
+#[derive(Debug, Serialize)]
+struct MediaPipeReset {
+    reset: bool,
+}
+
 #[derive(Debug, Deserialize)]
 pub struct MediaPipeResult {
     pub pose_landmarks: Vec<[f64; 3]>,    // Make public
@@ -22,7 +30,9 @@ pub struct MediaPipeResult {
 
 pub struct MediaPipeWrapper {
     python_process: Child,
-    stdin: std::process::ChildStdin,
+    // Buffered so a msgpack message's markers, keys and lengths go out in one
+    // write instead of a syscall each; flushed after every message
+    stdin: BufWriter<std::process::ChildStdin>,
     stdout: BufReader<std::process::ChildStdout>,
 }
 
@@ -100,7 +110,7 @@ impl MediaPipeWrapper {
         
         Ok(Self {
             python_process: child,
-            stdin,
+            stdin: BufWriter::new(stdin),
             stdout,
         })
     }
@@ -111,15 +121,15 @@ impl MediaPipeWrapper {
         let frame_data = MediaPipeFrame {
             width: rgb.width(),
             height: rgb.height(),
+            format: "RGB",
             data: rgb.into_raw(),
         };
         
         eprintln!("Sending frame: {}x{} ({} bytes)", 
                  frame_data.width, frame_data.height, frame_data.data.len());
         
-        // Send frame to Python
-        let json_data = serde_json::to_string(&frame_data)?;
-        writeln!(self.stdin, "{}", json_data)?;
+        // Send frame to Python as a msgpack map
+        rmp_serde::encode::write_named(&mut self.stdin, &frame_data)?;
         self.stdin.flush()?;
         
         // Read response
@@ -144,6 +154,21 @@ impl MediaPipeWrapper {
         Ok(result)
     }
     
+    // Clear tracking between clips while keeping the Python process and its
+    // loaded models alive; much cheaper than respawning the service
+    pub fn reset(&mut self) -> Result<()> {
+        rmp_serde::encode::write_named(&mut self.stdin, &MediaPipeReset { reset: true })?;
+        self.stdin.flush()?;
+        
+        // Every message gets exactly one response line
+        let mut response = String::new();
+        if self.stdout.read_line(&mut response)
+            .context("Failed to read reset response from MediaPipe")? == 0 {
+            return Err(anyhow::anyhow!("Python process terminated"));
+        }
+        Ok(())
+    }
+    
     pub fn get_pose_landmarks(&mut self, image: &DynamicImage) -> Result<Vec<Vector3<f64>>> {
         let result = self.process_image(image)?;
         Ok(result.pose_landmarks.into_iter()
@@ -359,6 +359,19 @@ impl ArmTracker {
         false
     }
     
+    // End a clip without stopping the service: the next clip reuses the warm
+    // process. Falls back to a full shutdown if the service doesn't answer.
+    pub fn reset_mediapipe_session(&mut self) {
+        let error = match self.mediapipe.as_mut() {
+            Some(mp) => mp.reset().err(),
+            None => None,
+        };
+        if let Some(e) = error {
+            eprintln!("MediaPipe session reset failed: {}", e);
+            self.shutdown_mediapipe();
+        }
+    }
+    
     pub fn reset_mediapipe(&mut self) {
         self.shutdown_mediapipe();
         eprintln!("MediaPipe reset - call initialize_mediapipe() to retry");